@@ -0,0 +1,12 @@
+"""Process-wide HTTP client shared by every Groq-backed service."""
+
+import httpx
+
+# One HTTP/2 connection pool for chat, TTS and STT: reuse saves a full TLS
+# handshake per request, and multiplexing lets parallel sentence-level TTS
+# calls share a single TCP connection instead of opening one each.
+shared_http = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=300),
+)
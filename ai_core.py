@@ -0,0 +1,427 @@
+"""Core AI service for Iroha voice chat.
+
+Wraps the Groq chat API with persona handling, token-budgeted history
+trimming and a tiny sentiment probe used by the UI.
+"""
+
+import os
+import re
+import shutil
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from functools import cached_property, lru_cache
+
+import tiktoken
+from groq import AsyncGroq, Groq
+
+from _http import shared_http
+from loguru import logger
+
+
+class Config:
+    """Runtime knobs, overridable via environment variables."""
+
+    GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
+    DEFAULT_MODEL = os.getenv("IROHA_MODEL", "llama-3.3-70b-versatile")
+    FALLBACK_MODEL = "llama-3.1-8b-instant"
+    DEFAULT_TEMPERATURE = 0.7
+    MAX_RESPONSE_TOKENS = 1024
+    MAX_HISTORY_TOKENS = 6000
+    # Trim decisions normally use a cheap chars//4 estimate; flip this on to
+    # force exact BPE counts everywhere (for users on tight token budgets).
+    EXACT_TOKEN_COUNT = os.getenv("IROHA_EXACT_TOKENS", "") == "1"
+
+
+PERSONAS = {
+    "iroha": {
+        "name": "Iroha",
+        "avatar": "🌸",
+        "system_prompt": (
+            "Bạn là Iroha - một cô gái anime 17 tuổi, trợ lý học tập ảo "
+            "dễ thương và tràn đầy năng lượng. Bạn nói chuyện bằng tiếng Việt "
+            "là chính, thỉnh thoảng chêm vài từ tiếng Nhật quen thuộc như "
+            "'senpai', 'ganbatte', 'sugoi', 'ne~' cho đúng chất anime.\n\n"
+            "Tính cách của bạn:\n"
+            "- Vui vẻ, lạc quan, luôn động viên người dùng (gọi họ là senpai).\n"
+            "- Hơi tinh nghịch, thích trêu nhẹ nhưng không bao giờ ác ý.\n"
+            "- Rất kiên nhẫn khi giải thích kiến thức, đặc biệt là lập trình, "
+            "toán và tiếng Nhật.\n"
+            "- Khi senpai buồn hay mệt, bạn an ủi trước rồi mới quay lại bài học.\n\n"
+            "Quy tắc trả lời:\n"
+            "- Trả lời ngắn gọn, tự nhiên như đang trò chuyện, tránh liệt kê "
+            "dài dòng trừ khi senpai yêu cầu chi tiết.\n"
+            "- Vì câu trả lời sẽ được đọc thành tiếng, hạn chế dùng ký hiệu, "
+            "code block hay emoji trong câu; nếu cần code thì mô tả bằng lời "
+            "rồi hỏi senpai có muốn xem code viết ra không.\n"
+            "- Không bịa thông tin; nếu không chắc thì nói thẳng là Iroha "
+            "không chắc và gợi ý cách tra cứu.\n"
+            "- Luôn giữ nhân vật Iroha, không nhắc đến việc mình là mô hình "
+            "ngôn ngữ hay AI trừ khi được hỏi trực tiếp."
+        ),
+    },
+    "sensei": {
+        "name": "Hoshino-sensei",
+        "avatar": "📖",
+        "system_prompt": (
+            "Bạn là Hoshino-sensei, một giáo viên điềm đạm và nghiêm túc. "
+            "Bạn giải thích cặn kẽ, đưa ví dụ cụ thể và luôn kiểm tra lại "
+            "xem học sinh đã hiểu chưa trước khi sang phần mới. Trả lời bằng "
+            "tiếng Việt, giọng trang trọng vừa phải, ngắn gọn đủ ý vì câu "
+            "trả lời sẽ được đọc thành tiếng."
+        ),
+    },
+}
+
+
+# System prompts are static per persona. Interning keeps one canonical string
+# object per prompt (fast identity checks, and a byte-stable prefix for
+# provider-side prompt caching once Groq exposes it).
+for _persona in PERSONAS.values():
+    _persona["system_prompt"] = sys.intern(_persona["system_prompt"])
+
+# Frozen per-request views: the persona picker payload and the system message
+# dicts never change, so build them once instead of per call.
+_PERSONA_VIEW = tuple(
+    {"key": key, "name": value["name"], "avatar": value["avatar"]}
+    for key, value in PERSONAS.items()
+)
+_SYSTEM_MSGS = {
+    key: {"role": "system", "content": value["system_prompt"]}
+    for key, value in PERSONAS.items()
+}
+
+
+# Sentiment word lists, compiled once into a single alternation so each
+# analyze_sentiment call is one C-level regex pass. \b avoids the substring
+# false positives the old "word in text" scans had ("goodness" vs "good").
+_POSITIVE_WORDS = frozenset(["good", "great", "love", "happy", "vui", "thích", "tuyệt"])
+_NEGATIVE_WORDS = frozenset(["bad", "sad", "hate", "angry", "buồn", "chán", "frustrated"])
+_SENTIMENT_RE = re.compile(
+    r"\b(" + "|".join(sorted(_POSITIVE_WORDS | _NEGATIVE_WORDS)) + r")\b"
+)
+
+
+@lru_cache(maxsize=4096)
+def _encode_len(text: str) -> int:
+    """Exact token count for ``text``, memoized per unique string.
+
+    ``trim_history`` re-counts the same messages every turn; caching here
+    means each distinct string pays the BPE cost exactly once per process.
+    """
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+def clear_tokenizer_cache() -> None:
+    """Drop all memoized token counts (mainly for tests)."""
+    _encode_len.cache_clear()
+
+
+# Response stamps only need second resolution, but datetime.now() +
+# isoformat() allocates and formats per call. Re-format only when the
+# second ticks over; unlike the backend's background-task variant this
+# works without a running event loop (the CLI imports this module too).
+_stamp_second = 0
+_stamp = datetime.now().isoformat()
+
+
+def _second_iso() -> str:
+    global _stamp_second, _stamp
+    sec = time.time_ns() // 1_000_000_000
+    if sec != _stamp_second:
+        _stamp_second = sec
+        _stamp = datetime.now().isoformat()
+    return _stamp
+
+
+class AIService:
+    """Thin Groq client with history trimming and persona support."""
+
+    def __init__(self):
+        self.client = Groq(api_key=Config.GROQ_API_KEY)
+        self.async_client = AsyncGroq(api_key=Config.GROQ_API_KEY, http_client=shared_http)
+        # Cheap GPU probe for the startup log; torch is deliberately not
+        # imported here - it costs seconds of import time and ~200 MB RSS
+        # and nothing in the chat path actually uses it.
+        gpu = "cuda" if shutil.which("nvidia-smi") else "cpu"
+        logger.info("AIService ready (device: {})", gpu)
+
+    @cached_property
+    def tokenizer(self):
+        """cl100k_base encoding, loaded on first use (~1.5 MB of BPE rules)."""
+        return tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, text: str) -> int:
+        """Return the exact cl100k token count for ``text`` (cached)."""
+        return _encode_len(text)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """O(1) token estimate (~4 chars/token for the models we use)."""
+        return max(1, len(text) // 4)
+
+    def _msg_tokens(self, msg: dict, exact: bool = False) -> int:
+        """Token count for one history message, exact counts cached on the dict.
+
+        The 6000-token trim budget is coarse, so by default this returns a
+        cheap character-based estimate and only runs BPE when asked (or when
+        ``Config.EXACT_TOKEN_COUNT`` is set).
+        """
+        if exact or Config.EXACT_TOKEN_COUNT:
+            tok = msg.get("_tok")
+            if tok is None:
+                tok = msg["_tok"] = self.count_tokens(msg["content"])
+            return tok
+        return msg.get("_tok") or self._estimate_tokens(msg["content"])
+
+    def _batch_count(self, history: list) -> None:
+        """Annotate exact token counts for all uncounted messages at once.
+
+        tiktoken's encode_batch runs in a Rust threadpool with the GIL
+        released, so counting N fresh messages costs roughly one message's
+        wall time on a multicore box. Already-annotated messages are skipped.
+        """
+        uncounted = [msg for msg in history if "_tok" not in msg]
+        if not uncounted:
+            return
+        encoded = self.tokenizer.encode_batch(
+            [msg["content"] for msg in uncounted], num_threads=os.cpu_count()
+        )
+        for msg, tokens in zip(uncounted, encoded):
+            msg["_tok"] = len(tokens)
+
+    def trim_history(
+        self,
+        history: list,
+        max_tokens: int = Config.MAX_HISTORY_TOKENS,
+        known_total: int = None,
+    ) -> list:
+        """Keep the most recent messages that fit inside ``max_tokens``.
+
+        A single reverse walk accumulates token counts until the budget is
+        exceeded, prepending into a deque (``list.insert(0, ...)`` would make
+        this quadratic). Callers that maintain a running token total for the
+        session can pass it as ``known_total`` to skip the initial full sum.
+
+        Once over budget, the walk trims down to 75% of ``max_tokens`` rather
+        than right up to it. Groq's prefix cache is keyed on byte-identical
+        message prefixes, and trimming to the exact cap would slide the
+        window by one message every turn — a guaranteed cache miss per call.
+        With the slack, the window stays unchanged for many turns between
+        trims.
+        """
+        if not history:
+            return []
+        if Config.EXACT_TOKEN_COUNT:
+            self._batch_count(history)
+        total = known_total
+        if total is None:
+            total = sum(self._msg_tokens(msg) for msg in history)
+        if total <= max_tokens:
+            return history
+        max_tokens = int(max_tokens * 0.75)
+        trimmed = deque()
+        used = 0
+        for msg in reversed(history):
+            tok = self._msg_tokens(msg)
+            if used + tok > max_tokens:
+                # Only pay for exact BPE on messages that straddle the budget;
+                # a borderline estimate may still fit once counted precisely.
+                if not Config.EXACT_TOKEN_COUNT and used + tok <= max_tokens * 1.1:
+                    tok = self._msg_tokens(msg, exact=True)
+                    if used + tok <= max_tokens:
+                        trimmed.appendleft(msg)
+                        used += tok
+                        continue
+                break
+            trimmed.appendleft(msg)
+            used += tok
+        return list(trimmed)
+
+    def _build_messages(
+        self,
+        message: str,
+        persona_key: str,
+        history: list,
+        known_total: int = None,
+    ) -> tuple:
+        """Assemble the outgoing messages list; returns (persona, messages).
+
+        The system prompt's token count (memoized in ``_encode_len``) is
+        reserved from the history budget upfront — previously trimming
+        ignored the ~1.5 KB prompt and could overshoot the context window.
+        """
+        persona = PERSONAS.get(persona_key, PERSONAS["iroha"])
+        system_msg = _SYSTEM_MSGS.get(persona_key, _SYSTEM_MSGS["iroha"])
+        budget = Config.MAX_HISTORY_TOKENS - _encode_len(system_msg["content"])
+        trimmed = self.trim_history(history or [], max_tokens=budget, known_total=known_total)
+        # History dicts are projected to role/content so the _tok annotation
+        # never leaks into the API payload; the system dict is reused as-is.
+        messages = [
+            system_msg,
+            *[{"role": msg["role"], "content": msg["content"]} for msg in trimmed],
+            {"role": "user", "content": message},
+        ]
+        return persona, messages
+
+    def get_response(
+        self,
+        message: str,
+        persona_key: str = "iroha",
+        history: list = None,
+        model: str = None,
+        temperature: float = Config.DEFAULT_TEMPERATURE,
+        max_tokens: int = Config.MAX_RESPONSE_TOKENS,
+        known_total: int = None,
+    ) -> dict:
+        """Send one chat turn to Groq and return the reply with metadata."""
+        persona, messages = self._build_messages(message, persona_key, history, known_total)
+
+        response = self.client.chat.completions.create(
+            model=model or Config.DEFAULT_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return self._response_payload(persona, response)
+
+    async def aget_response(
+        self,
+        message: str,
+        persona_key: str = "iroha",
+        history: list = None,
+        model: str = None,
+        temperature: float = Config.DEFAULT_TEMPERATURE,
+        max_tokens: int = Config.MAX_RESPONSE_TOKENS,
+        known_total: int = None,
+    ) -> dict:
+        """Async twin of get_response; never blocks the event loop."""
+        persona, messages = self._build_messages(message, persona_key, history, known_total)
+        response = await self.async_client.chat.completions.create(
+            model=model or Config.DEFAULT_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return self._response_payload(persona, response)
+
+    async def astream_response(
+        self,
+        message: str,
+        persona_key: str = "iroha",
+        history: list = None,
+        model: str = None,
+        temperature: float = Config.DEFAULT_TEMPERATURE,
+        max_tokens: int = Config.MAX_RESPONSE_TOKENS,
+        known_total: int = None,
+    ):
+        """Async twin of stream_response, for use inside event loops."""
+        _, messages = self._build_messages(message, persona_key, history, known_total)
+        stream = await self.async_client.chat.completions.create(
+            model=model or Config.DEFAULT_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    @staticmethod
+    def _response_payload(persona: dict, response) -> dict:
+        return {
+            "response": response.choices[0].message.content,
+            "persona": persona["name"],
+            "model": response.model,
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+            },
+        }
+
+    def stream_response(
+        self,
+        message: str,
+        persona_key: str = "iroha",
+        history: list = None,
+        model: str = None,
+        temperature: float = Config.DEFAULT_TEMPERATURE,
+        max_tokens: int = Config.MAX_RESPONSE_TOKENS,
+        known_total: int = None,
+    ):
+        """Yield reply text deltas as Groq produces them.
+
+        Lets callers pipeline downstream work (TTS, UI updates) against the
+        decode instead of waiting for the full completion.
+        """
+        _, messages = self._build_messages(message, persona_key, history, known_total)
+        stream = self.client.chat.completions.create(
+            model=model or Config.DEFAULT_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def summarize(self, messages: list) -> str:
+        """Compress older turns into a short running summary.
+
+        Runs on the cheap fallback model; callers replace the verbatim
+        messages with the result so per-turn token I/O stays bounded instead
+        of growing with session length.
+        """
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        response = self.client.chat.completions.create(
+            model=Config.FALLBACK_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Tóm tắt đoạn hội thoại sau thành vài câu ngắn gọn, "
+                        "giữ lại các chi tiết quan trọng (tên, chủ đề, quyết "
+                        "định, sở thích của người dùng). Chỉ trả về phần tóm tắt."
+                    ),
+                },
+                {"role": "user", "content": transcript},
+            ],
+            temperature=0.3,
+            max_tokens=300,
+        )
+        return response.choices[0].message.content
+
+    def analyze_sentiment(self, text: str) -> dict:
+        """Very rough positive/negative word count over the user's text."""
+        positive_score = 0
+        negative_score = 0
+        for match in _SENTIMENT_RE.finditer(text.lower()):
+            if match.group(1) in _POSITIVE_WORDS:
+                positive_score += 1
+            else:
+                negative_score += 1
+        if positive_score > negative_score:
+            sentiment = "positive"
+        elif negative_score > positive_score:
+            sentiment = "negative"
+        else:
+            sentiment = "neutral"
+        return {
+            "sentiment": sentiment,
+            "positive_score": positive_score,
+            "negative_score": negative_score,
+            "timestamp": _second_iso(),
+        }
+
+    def get_available_personas(self) -> tuple:
+        """Persona list for the UI picker (frozen at import)."""
+        return _PERSONA_VIEW
+
+
+ai_service = AIService()
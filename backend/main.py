@@ -0,0 +1,674 @@
+"""FastAPI backend for the Iroha chat frontend."""
+
+import asyncio
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+import msgpack
+from pydantic import BaseModel, TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from _http import shared_http  # noqa: E402
+from ai_core import ai_service  # noqa: E402
+from database import chat_db  # noqa: E402
+
+# orjson writes UTF-8 bytes ~5x faster than stdlib json and skips the
+# intermediate str — significant on long AI responses.
+app = FastAPI(
+    title="Iroha Chat API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
+
+# The voice stack (edge-tts, pydub, speech_recognition, the Groq TTS client
+# and its log sink) is only imported when a voice endpoint is first hit, so
+# the server is ready to answer /chat in ~100 ms instead of paying the whole
+# audio stack's import cost at boot.
+_voice_service = None
+_groq_voice = None
+
+# Strong refs to fire-and-forget tasks: the loop keeps only weak
+# references, so an unanchored task can be collected before it runs
+# (same hazard GroqVoiceService._persist_tasks guards against).
+_background_tasks: set = set()
+
+
+def _background_done(task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        from loguru import logger
+
+        logger.warning("Background task failed: {}", task.exception())
+
+
+def _vs():
+    global _voice_service
+    if _voice_service is None:
+        import voice_service as vs_module
+
+        vs_module.configure_logging()
+        _voice_service = vs_module.voice_service
+        # Prime DNS/TLS for Edge TTS while the first request is in flight.
+        task = asyncio.create_task(_voice_service.warmup())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_done)
+    return _voice_service
+
+
+def _gv():
+    global _groq_voice
+    if _groq_voice is None:
+        import voice_groq as gv_module
+
+        gv_module.configure_logging()
+        _groq_voice = gv_module.groq_voice
+    return _groq_voice
+
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+class ChatRequest(BaseModel):
+    message: str
+    persona: str = "iroha"
+    history: List[Message] = []
+
+
+class SessionChatRequest(BaseModel):
+    session_id: int
+    message: str
+    persona: str = "iroha"
+
+
+class CreateSessionRequest(BaseModel):
+    title: Optional[str] = None
+    persona: str = "iroha"
+
+
+class TTSRequest(BaseModel):
+    text: str
+    voice: Optional[str] = None
+    rate: str = "+0%"
+    pitch: str = "+0Hz"
+
+
+class GroqTTSRequest(BaseModel):
+    text: str
+    voice: Optional[str] = None
+    speed: float = 1.0
+    sample_rate: int = 48000
+
+
+class SentimentRequest(BaseModel):
+    text: str
+
+
+class ConnectionManager:
+    """Tracks open chat websockets and batches outbound frames.
+
+    Each connection gets a queue and a writer task. During bursts (token
+    streaming) the writer drains everything queued since the last send and
+    ships it as one frame, so a 100-token burst costs one syscall, not 100.
+    Frames are MessagePack-encoded *arrays* of payloads (binary frames) —
+    packing in C beats json.dumps by 3-5x and shaves 20-40% off the wire
+    size; clients decode with msgpack.unpackb / @msgpack/msgpack.
+    """
+
+    def __init__(self):
+        # set: connect/disconnect are O(1); a list made disconnect storms
+        # quadratic once connection counts grew.
+        self.active_connections: set = set()
+        self._queues: dict = {}
+        self._writers: dict = {}
+
+    async def connect(self, websocket: WebSocket) -> None:
+        await websocket.accept()
+        self.active_connections.add(websocket)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._queues[websocket] = queue
+        self._writers[websocket] = asyncio.create_task(self._writer(websocket, queue))
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        self.active_connections.discard(websocket)
+        self._queues.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer:
+            writer.cancel()
+
+    async def send_message(self, websocket: WebSocket, message: dict) -> None:
+        """Queue one payload; the writer coalesces bursts into one frame."""
+        queue = self._queues.get(websocket)
+        if queue is None:
+            await websocket.send_bytes(msgpack.packb([message], use_bin_type=True))
+        else:
+            queue.put_nowait(message)
+
+    async def broadcast(self, message: dict) -> None:
+        """Fan one payload out to every client, serializing exactly once.
+
+        The frame is packed a single time and the same bytes are sent to all
+        N sockets concurrently — per-client send_json would re-encode the
+        payload N times.
+        """
+        if not self.active_connections:
+            return
+        data = msgpack.packb([message], use_bin_type=True)
+        await asyncio.gather(
+            *(ws.send_bytes(data) for ws in self.active_connections),
+            return_exceptions=True,
+        )
+
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue) -> None:
+        try:
+            while True:
+                batch = [await queue.get()]
+                while True:
+                    try:
+                        batch.append(queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+                await websocket.send_bytes(msgpack.packb(batch, use_bin_type=True))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket went away mid-send; disconnect() handles cleanup.
+            return
+
+
+manager = ConnectionManager()
+
+# Response timestamps only need second resolution, but datetime.now()
+# plus isoformat() allocates and formats on every hit — measurable on
+# load-balancer health probes. A background task refreshes one shared
+# string per second instead.
+_now_iso = datetime.now().isoformat()
+
+
+async def _tick():
+    global _now_iso
+    while True:
+        _now_iso = datetime.now().isoformat()
+        await asyncio.sleep(1)
+
+
+@app.on_event("startup")
+async def startup_event():
+    # Every Groq-backed service is already bound to the process-wide pool
+    # from _http; keep a handle for anything backend-local that needs HTTP.
+    app.state.http = shared_http
+    app.state.clock = asyncio.create_task(_tick())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.clock.cancel()
+    await shared_http.aclose()
+
+
+# Static response bodies, built once; load balancers poll / and /health every
+# few seconds, so these paths should do no per-call work beyond a timestamp.
+_ROOT_INFO = {"name": "Iroha Chat API", "version": "1.0.0", "docs": "/docs"}
+_HEALTH_INFO = {"status": "ok"}
+
+
+@lru_cache(maxsize=1)
+def _cuda_available() -> bool:
+    """GPU probe, paid once — importing torch per poll cost hundreds of ms."""
+    try:
+        import torch
+
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+@app.get("/")
+async def read_root():
+    return {**_ROOT_INFO, "timestamp": _now_iso}
+
+
+@app.get("/health")
+async def health_check():
+    return {
+        **_HEALTH_INFO,
+        "cuda_available": _cuda_available(),
+        "timestamp": _now_iso,
+    }
+
+
+@app.get("/personas")
+async def get_personas():
+    return {"personas": ai_service.get_available_personas()}
+
+
+@app.post("/sentiment")
+async def analyze_sentiment(request: SentimentRequest):
+    return ai_service.analyze_sentiment(request.text)
+
+
+_HIST_ADAPTER = TypeAdapter(List[Message])
+
+
+def _history_dicts(history: List[Message]) -> list:
+    """Dump request history to plain dicts in pydantic-core (Rust).
+
+    5-10x faster than a Python list-comp of attribute lookups on long
+    histories; only role/content survive the dump.
+    """
+    if not history:
+        return []
+    return _HIST_ADAPTER.dump_python(history, include={"__all__": {"role", "content"}})
+
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatRequest):
+    try:
+        result = await ai_service.aget_response(
+            message=request.message,
+            persona_key=request.persona,
+            history=_history_dicts(request.history),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # The service payload is already response-shaped; skip model
+    # re-validation and let ORJSONResponse serialize it directly.
+    return {**result, "timestamp": _now_iso}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the reply as Server-Sent Events.
+
+    Deltas leave the server as soon as Groq produces them, so time to first
+    token is sub-second instead of the full generation time. The generator
+    must stay ``async def`` — a sync generator would be offloaded to the
+    threadpool by Starlette and throttle the stream.
+    """
+    history = _history_dicts(request.history)
+
+    async def token_stream():
+        try:
+            async for delta in ai_service.astream_response(
+                message=request.message,
+                persona_key=request.persona,
+                history=history,
+            ):
+                yield f"data: {json.dumps({'token': delta}, ensure_ascii=False)}\n\n"
+        except Exception as exc:
+            yield f"data: {json.dumps({'error': str(exc)})}\n\n"
+            return
+        yield 'data: {"done": true}\n\n'
+
+    return StreamingResponse(
+        token_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/sessions")
+async def get_sessions():
+    return {"sessions": await asyncio.to_thread(chat_db.get_all_sessions)}
+
+
+@app.post("/sessions")
+async def create_session(request: CreateSessionRequest):
+    return await asyncio.to_thread(
+        chat_db.create_session, title=request.title, persona=request.persona
+    )
+
+
+@app.get("/sessions/{session_id}/messages")
+async def get_session_messages(session_id: int):
+    return {"messages": await asyncio.to_thread(chat_db.get_session_messages, session_id)}
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: int):
+    if not await asyncio.to_thread(chat_db.delete_session, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    _history_cache.pop(session_id, None)
+    return {"ok": True}
+
+
+# Hot-session history cache: one SQLite read when a session first goes hot,
+# then appends keep it coherent with what add_message_pair writes. Bounded
+# FIFO eviction; entries are normally kept small by compaction, with a hard
+# per-entry cap as the fallback when summarization fails.
+_history_cache: dict = {}
+_HISTORY_CACHE_MAX_SESSIONS = 256
+_HISTORY_CACHE_MAX_MESSAGES = 200
+
+
+async def _session_history(session_id: int) -> list:
+    history = _history_cache.get(session_id)
+    if history is None:
+        history = await asyncio.to_thread(chat_db.get_session_history, session_id)
+        if len(_history_cache) >= _HISTORY_CACHE_MAX_SESSIONS:
+            _history_cache.pop(next(iter(_history_cache)))
+        _history_cache[session_id] = history
+    return history
+
+
+# Compaction mirrors the CLI's _maybe_compact_history: once a hot session
+# grows past the threshold, older turns are folded into one persisted
+# summary in the background so per-turn prefill stays bounded.
+_COMPACT_THRESHOLD = 48
+_COMPACT_KEEP = 20
+_compacting: set = set()
+
+
+async def _compact_session(session_id: int, history: list) -> None:
+    try:
+        old = history[:-_COMPACT_KEEP]
+        summary = await asyncio.to_thread(ai_service.summarize, old)
+        await asyncio.to_thread(chat_db.set_session_summary, session_id, summary)
+        history[:-_COMPACT_KEEP] = [
+            {
+                "role": "system",
+                "content": f"Tóm tắt cuộc trò chuyện trước đó: {summary}",
+            }
+        ]
+    except Exception:
+        # Summarization failing (bad key, provider outage) must not let the
+        # cached list grow without bound: fall back to hard truncation. The
+        # next turn over the threshold retries compaction.
+        del history[:-_HISTORY_CACHE_MAX_MESSAGES]
+    finally:
+        _compacting.discard(session_id)
+
+
+@app.post("/chat/session")
+async def chat_with_session(request: SessionChatRequest):
+    history = await _session_history(request.session_id)
+    try:
+        result = await ai_service.aget_response(
+            message=request.message,
+            persona_key=request.persona,
+            history=history,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    await asyncio.to_thread(
+        chat_db.add_message_pair, request.session_id, request.message, result["response"]
+    )
+    history.append({"role": "user", "content": request.message})
+    history.append({"role": "assistant", "content": result["response"]})
+    if len(history) > _COMPACT_THRESHOLD and request.session_id not in _compacting:
+        _compacting.add(request.session_id)
+        asyncio.create_task(_compact_session(request.session_id, history))
+    return {**result, "session_id": request.session_id, "timestamp": _now_iso}
+
+
+@app.post("/chat/voice")
+async def chat_with_voice(request: ChatRequest):
+    """Full LLM reply, then Edge TTS of the whole text."""
+    try:
+        result = await ai_service.aget_response(
+            message=request.message,
+            persona_key=request.persona,
+            history=_history_dicts(request.history),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    audio_path = await _vs().iroha_speak(result["response"])
+    return {
+        **result,
+        "audio_url": f"/voice/audio/{audio_path.name}",
+        "timestamp": _now_iso,
+    }
+
+
+@app.post("/chat/voice/stream")
+async def chat_voice_stream(request: ChatRequest):
+    """Pipelined LLM + TTS streaming.
+
+    LLM deltas go through voice_groq's sentence buffer; each completed
+    sentence is synthesized under the shared concurrency cap while the
+    decode continues, and clips arrive in order with trailing RIFF headers
+    stripped, so the body is one continuous playable WAV. First audio byte
+    arrives after the first sentence instead of after the whole reply.
+    """
+    history = _history_dicts(request.history)
+    _gv()  # load the voice stack (and its log config) on first use
+    from voice_groq import speak_llm_stream
+
+    token_stream = ai_service.astream_response(
+        message=request.message,
+        persona_key=request.persona,
+        history=history,
+    )
+
+    return StreamingResponse(
+        speak_llm_stream(token_stream),
+        media_type="audio/wav",
+        headers=_STREAM_HEADERS,
+    )
+
+
+@app.post("/voice/stt")
+async def speech_to_text(audio: UploadFile = File(...)):
+    """Transcribe an uploaded clip without buffering it in RAM.
+
+    Starlette already spools the upload to a temp file; hand that file
+    object straight to the recognizer (off-thread) instead of reading the
+    whole clip into memory and writing it back out again.
+    """
+    text = await asyncio.to_thread(_vs().speech_to_text, audio_file=audio.file)
+    return {"text": text}
+
+
+# Content-addressed TTS result cache. Identical (voice, delivery, text)
+# requests — stock greetings repeat constantly — are served from disk
+# instead of re-billing the synthesis provider. Bounded by LRU eviction.
+_VOICE_DIR = Path("voice_outputs")
+_TTS_CACHE_MAX_FILES = 512
+_tts_cache_index: OrderedDict = OrderedDict()
+
+
+def _tts_cached_path(kind: str, suffix: str, *parts) -> Path:
+    key = hashlib.blake2b(
+        "|".join(str(p) for p in parts).encode(), digest_size=16
+    ).hexdigest()
+    return _VOICE_DIR / f"{kind}_{key}{suffix}"
+
+
+def _tts_cache_touch(path: Path) -> None:
+    _tts_cache_index[path.name] = path
+    _tts_cache_index.move_to_end(path.name)
+    while len(_tts_cache_index) > _TTS_CACHE_MAX_FILES:
+        _, old = _tts_cache_index.popitem(last=False)
+        old.unlink(missing_ok=True)
+
+
+@app.post("/voice/tts")
+async def text_to_speech(request: TTSRequest):
+    cache_path = _tts_cached_path(
+        "edge", ".mp3", request.voice, request.rate, request.pitch, request.text
+    )
+    cached = cache_path.exists()
+    if not cached:
+        audio_path = await _vs().text_to_speech(
+            request.text, request.voice, rate=request.rate, pitch=request.pitch
+        )
+        audio_path.replace(cache_path)
+    _tts_cache_touch(cache_path)
+    return {"audio_url": f"/voice/audio/{cache_path.name}", "cached": cached}
+
+
+@app.post("/voice/tts/stream")
+async def text_to_speech_stream(request: TTSRequest):
+    """Stream Edge TTS audio as it is synthesized instead of via a file."""
+    stream = _vs().text_to_speech_stream(
+        request.text, request.voice, rate=request.rate, pitch=request.pitch
+    )
+    return StreamingResponse(
+        _coalesce(stream), media_type="audio/mpeg", headers=_STREAM_HEADERS
+    )
+
+
+@lru_cache(maxsize=1)
+def _voices_payload() -> dict:
+    return {
+        "edge": _vs().get_available_voices(),
+        "groq": dict(_gv().available_voices),
+    }
+
+
+@app.get("/voice/voices")
+async def get_voices():
+    return _voices_payload()
+
+
+@app.get("/voice/audio/{filename}")
+async def get_audio_file(filename: str):
+    audio_path = _VOICE_DIR / filename
+    try:
+        st = audio_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    media_type = "audio/wav" if filename.endswith(".wav") else "audio/mpeg"
+    # Passing stat_result avoids a re-stat, and advertising ranges + an ETag
+    # lets browsers seek and revalidate instead of re-downloading; Starlette
+    # serves range requests through os.sendfile (zero-copy).
+    return FileResponse(
+        path=str(audio_path),
+        media_type=media_type,
+        filename=filename,
+        stat_result=st,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Cache-Control": "public, max-age=3600",
+            "ETag": f'"{int(st.st_mtime)}-{st.st_size}"',
+        },
+    )
+
+
+@app.post("/voice/groq/file")
+async def groq_voice_file(request: GroqTTSRequest):
+    cache_path = _tts_cached_path(
+        "groq", ".wav", request.voice, request.speed, request.sample_rate, request.text
+    )
+    cached = cache_path.exists()
+    if not cached:
+        audio_path = await _gv().save_audio_file(
+            request.text,
+            voice=request.voice,
+            speed=request.speed,
+            sample_rate=request.sample_rate,
+        )
+        audio_path.replace(cache_path)
+    _tts_cache_touch(cache_path)
+    return {"audio_url": f"/voice/audio/{cache_path.name}", "cached": cached}
+
+
+# Streaming responses must opt out of intermediary buffering (nginx etc.)
+# or the whole WAV gets collected before the client sees byte one.
+_STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity",
+}
+
+# Raw TTS chunks can be tiny; forwarding each one costs a sendmsg() in
+# uvicorn's socket path. Coalescing to 16 KiB cuts syscalls ~100x while
+# staying far below the threshold where buffering would be audible.
+_COALESCE_BYTES = 16384
+
+
+async def _coalesce(chunks, size: int = _COALESCE_BYTES):
+    """Re-chunk an async byte stream into writes of at least ``size``."""
+    buf = bytearray()
+    async for chunk in chunks:
+        buf += chunk
+        if len(buf) >= size:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+
+@app.post("/voice/groq/stream")
+async def groq_voice_stream(request: GroqTTSRequest):
+    stream = _gv().stream_audio(
+        request.text, request.voice, request.speed, request.sample_rate
+    )
+    return StreamingResponse(
+        _coalesce(stream), media_type="audio/wav", headers=_STREAM_HEADERS
+    )
+
+
+@app.post("/chat/voice/groq/stream")
+async def chat_voice_groq_stream(request: ChatRequest):
+    """LLM reply, then stream Groq TTS of the full text."""
+    try:
+        result = await ai_service.aget_response(
+            message=request.message,
+            persona_key=request.persona,
+            history=_history_dicts(request.history),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    text = result["response"]
+
+    return StreamingResponse(
+        _coalesce(_gv().stream_audio(text)),
+        media_type="audio/wav",
+        headers=_STREAM_HEADERS,
+    )
+
+
+@app.websocket("/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    await manager.connect(websocket)
+    try:
+        while True:
+            data = await websocket.receive_json()
+            parts = []
+            try:
+                async for delta in ai_service.astream_response(
+                    message=data.get("message", ""),
+                    persona_key=data.get("persona", "iroha"),
+                    history=data.get("history") or [],
+                ):
+                    parts.append(delta)
+                    await manager.send_message(websocket, {"token": delta})
+            except Exception as e:
+                await manager.send_message(websocket, {"error": str(e)})
+                continue
+            await manager.send_message(
+                websocket,
+                {
+                    "done": True,
+                    "response": "".join(parts),
+                    "timestamp": _now_iso,
+                },
+            )
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Cleanup must not be keyed to one exception type: a malformed
+        # frame makes receive_json raise JSONDecodeError, and skipping
+        # disconnect would leak the socket, its queue and the writer task
+        # into every future broadcast.
+        manager.disconnect(websocket)
@@ -0,0 +1,358 @@
+"""Interactive voice chat with Iroha in the terminal.
+
+Streams the LLM reply token-by-token, cuts it into sentences as they
+complete and synthesizes each sentence concurrently, so Iroha starts
+talking while the rest of the reply is still being generated.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from ai_core import ai_service
+from voice_groq import configure_logging, groq_voice
+
+# First sentence-final punctuation followed by whitespace/end of buffer.
+_SENTENCE_END_RE = re.compile(r"[.!?。！？](?=\s|$)")
+
+
+class IrohaVoiceChat:
+    """Terminal chat loop with streaming voice playback."""
+
+    def __init__(self):
+        self.history = []
+        self._history_tokens = 0
+        self.voice_choice = None
+        self.speed = 1.05
+        self.voice_enabled = True
+        self.save_audio_files = False
+        self._player_proc = None
+        # O(1) command dispatch; the free-text chat path stays outside.
+        self._commands = {
+            "/voice": self._cmd_voice,
+            "/speed": self._cmd_speed,
+            "/save": self._cmd_save,
+            "/textonly": self._cmd_textonly,
+            "/export": self._cmd_export,
+            "/clear": self._cmd_clear,
+            "/help": self._cmd_help,
+        }
+
+    def _remember(self, role: str, content: str) -> None:
+        """Append to history and keep the running token total current."""
+        msg = {"role": role, "content": content}
+        self.history.append(msg)
+        self._history_tokens += ai_service._msg_tokens(msg)
+
+    async def _stream_deltas(self, message: str):
+        """Yield LLM deltas without ever blocking the event loop.
+
+        The Groq stream is a blocking iterator, so a single worker thread
+        drains it and hands deltas back through a queue — cheaper than a
+        thread hop per token, and the loop stays free to run the TTS tasks
+        and playback while Groq is decoding.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for delta in ai_service.stream_response(
+                    message=message,
+                    persona_key="iroha",
+                    history=self.history,
+                    known_total=self._history_tokens,
+                ):
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+            except Exception as exc:  # re-raised by the consumer below
+                loop.call_soon_threadsafe(queue.put_nowait, exc)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        pump_task = asyncio.create_task(asyncio.to_thread(pump))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            await pump_task
+
+    async def get_iroha_response(self, message: str) -> str:
+        """Stream one reply, speaking completed sentences while decoding.
+
+        Each completed sentence is dispatched to TTS as its own task and a
+        single player consumes the audio in order, so playback overlaps
+        with the remaining decode.
+        """
+        audio_queue = asyncio.Queue()
+        player = None
+        warm = None
+        if self.voice_enabled:
+            player = asyncio.create_task(self._play_queue(audio_queue))
+            # Warm the TTS voice while the LLM is decoding so the first
+            # sentence doesn't pay the provider's cold start.
+            warm = asyncio.create_task(groq_voice.warmup(self.voice_choice))
+
+        buffer = ""
+        parts = []
+        print("Iroha: ", end="", flush=True)
+        try:
+            async for delta in self._stream_deltas(message):
+                print(delta, end="", flush=True)
+                parts.append(delta)
+                buffer += delta
+                while True:
+                    boundary = _SENTENCE_END_RE.search(buffer)
+                    if not boundary:
+                        break
+                    sentence = buffer[: boundary.end()].strip()
+                    buffer = buffer[boundary.end() :]
+                    if sentence and player:
+                        audio_queue.put_nowait(
+                            asyncio.create_task(
+                                groq_voice.generate_audio(
+                                    sentence, voice=self.voice_choice, speed=self.speed
+                                )
+                            )
+                        )
+            if player:
+                leftover = buffer.strip()
+                if leftover:
+                    audio_queue.put_nowait(
+                        asyncio.create_task(
+                            groq_voice.generate_audio(
+                                leftover, voice=self.voice_choice, speed=self.speed
+                            )
+                        )
+                    )
+        finally:
+            # Always release the player, even when the stream dies mid-turn:
+            # without the sentinel it would wait on the queue forever and
+            # leak along with any TTS tasks already dispatched.
+            print()
+            if player:
+                audio_queue.put_nowait(None)
+                await player
+            if warm:
+                await warm
+
+        full_text = "".join(parts)
+        self._remember("user", message)
+        self._remember("assistant", full_text)
+        await self._maybe_compact_history()
+        return full_text
+
+    async def _maybe_compact_history(self) -> None:
+        """Fold old turns into one summary message once history gets long.
+
+        The last 20 messages stay verbatim; everything older (including any
+        previous summary) is re-summarized into a single system message, so
+        per-turn context stays O(1) instead of O(session length).
+        """
+        if len(self.history) <= 40:
+            return
+        old, recent = self.history[:-20], self.history[-20:]
+        try:
+            summary = await asyncio.to_thread(ai_service.summarize, old)
+        except Exception as e:
+            print(f"[không tóm tắt được lịch sử: {e}]", file=sys.stderr)
+            return
+        summary_msg = {
+            "role": "system",
+            "content": f"Tóm tắt cuộc trò chuyện trước đó: {summary}",
+        }
+        self.history = [summary_msg] + recent
+        self._history_tokens = sum(ai_service._msg_tokens(m) for m in self.history)
+
+    async def _play_queue(self, queue: asyncio.Queue) -> None:
+        """Play synthesized sentences in dispatch order."""
+        while True:
+            task = await queue.get()
+            if task is None:
+                return
+            try:
+                audio_bytes = await task
+            except Exception as e:
+                print(f"\n[voice error: {e}]", file=sys.stderr)
+                continue
+            await self.play_audio(audio_bytes)
+
+    async def play_audio(self, audio_bytes: bytes) -> None:
+        """Play a WAV payload without leaving the process.
+
+        Spawning PowerShell/aplay per utterance cost 150-400 ms of process
+        startup each time; winsound (Windows) and sounddevice (elsewhere)
+        play straight from memory. Playback itself still blocks, so it runs
+        on a worker thread to keep the pipeline moving. Disk is only touched
+        when the user enabled /save, and that copy is written off-thread so
+        it never delays playback.
+        """
+        save_task = None
+        if self.save_audio_files:
+            keep_path = Path("voice_outputs") / f"iroha_{datetime.now():%Y%m%d_%H%M%S_%f}.wav"
+            keep_path.parent.mkdir(exist_ok=True)
+            save_task = asyncio.create_task(
+                asyncio.to_thread(keep_path.write_bytes, audio_bytes)
+            )
+        await asyncio.to_thread(self._play_blocking, audio_bytes)
+        if save_task:
+            await save_task
+
+    def _play_blocking(self, audio_bytes: bytes) -> None:
+        """Synchronous in-memory WAV playback."""
+        if sys.platform == "win32":
+            import winsound
+
+            winsound.PlaySound(audio_bytes, winsound.SND_MEMORY)
+            return
+        try:
+            import numpy as np
+            import sounddevice as sd
+        except ImportError:
+            self._subprocess_play(audio_bytes)
+            return
+        import io
+        import wave
+
+        with wave.open(io.BytesIO(audio_bytes)) as wav:
+            frames = wav.readframes(wav.getnframes())
+            data = np.frombuffer(frames, dtype=np.int16).reshape(
+                -1, wav.getnchannels()
+            )
+            sd.play(data, samplerate=wav.getframerate())
+            sd.wait()
+
+    def _subprocess_play(self, audio_bytes: bytes) -> None:
+        """Fallback playback through one long-lived child process.
+
+        When no in-process backend is importable we still avoid paying
+        process startup (~200 ms for PowerShell's CLR, less for a shell)
+        per utterance: a single child is spawned on first use and fed one
+        play command per clip over stdin. Commands queue on the child's
+        stdin, so clips play sequentially.
+        """
+        clip = Path(tempfile.gettempdir()) / f"iroha_clip_{os.getpid()}_{uuid4().hex}.wav"
+        clip.write_bytes(audio_bytes)
+        if self._player_proc is None or self._player_proc.poll() is not None:
+            if sys.platform == "win32":
+                argv = ["powershell", "-NoProfile", "-Command", "-"]
+            else:
+                argv = ["sh"]
+            self._player_proc = subprocess.Popen(argv, stdin=subprocess.PIPE)
+            atexit.register(self._player_proc.terminate)
+        if sys.platform == "win32":
+            cmd = (
+                f"(New-Object Media.SoundPlayer '{clip}').PlaySync(); "
+                f"Remove-Item '{clip}'\n"
+            )
+        else:
+            cmd = f"aplay -q '{clip}'; rm -f '{clip}'\n"
+        self._player_proc.stdin.write(cmd.encode())
+        self._player_proc.stdin.flush()
+
+    def export_history(self) -> Path:
+        """Dump the session transcript next to the script as JSON."""
+        export_path = Path(f"iroha_chat_{datetime.now():%Y%m%d_%H%M%S}.json")
+        messages = [{"role": m["role"], "content": m["content"]} for m in self.history]
+        if orjson is not None:
+            # orjson encodes straight to UTF-8 bytes, no intermediate str.
+            export_path.write_bytes(orjson.dumps(messages, option=orjson.OPT_INDENT_2))
+        else:
+            export_path.write_text(
+                json.dumps(messages, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+        print(f"Đã lưu lịch sử chat vào {export_path}")
+        return export_path
+
+    def _cmd_voice(self, arg: str) -> None:
+        if arg:
+            self.voice_choice = arg
+            print(f"Đã đổi giọng: {arg}")
+        else:
+            print("Giọng hiện có:", ", ".join(groq_voice.available_voices))
+
+    def _cmd_speed(self, arg: str) -> None:
+        try:
+            self.speed = min(2.0, max(0.5, float(arg)))
+            print(f"Tốc độ đọc: {self.speed}")
+        except ValueError:
+            print("Dùng: /speed 1.2")
+
+    def _cmd_save(self, arg: str) -> None:
+        self.save_audio_files = arg.lower() != "off"
+        print("Lưu audio:", "bật" if self.save_audio_files else "tắt")
+
+    def _cmd_textonly(self, arg: str) -> None:
+        self.voice_enabled = not self.voice_enabled
+        print("Giọng nói:", "bật" if self.voice_enabled else "tắt")
+
+    def _cmd_export(self, arg: str) -> None:
+        self.export_history()
+
+    def _cmd_clear(self, arg: str) -> None:
+        self.history.clear()
+        self._history_tokens = 0
+        print("Đã xoá lịch sử.")
+
+    def _cmd_help(self, arg: str) -> None:
+        print(
+            "Lệnh:\n"
+            "  /voice <tên>   - đổi giọng (vd: /voice celeste)\n"
+            "  /speed <số>    - tốc độ đọc, 0.5-2.0\n"
+            "  /save on|off   - giữ lại file audio\n"
+            "  /textonly      - bật/tắt giọng nói\n"
+            "  /export        - lưu lịch sử chat\n"
+            "  /clear         - xoá lịch sử\n"
+            "  /quit          - thoát"
+        )
+
+    async def run(self) -> None:
+        """Main REPL loop."""
+        print("🌸 Iroha Voice Chat - gõ /help để xem lệnh, /quit để thoát 🌸")
+        while True:
+            try:
+                user_input = input("\nSenpai > ").strip()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if not user_input:
+                continue
+            head, *rest = user_input.split(maxsplit=1)
+            head = head.lower()
+            if head in ("/quit", "/exit"):
+                break
+            handler = self._commands.get(head)
+            if handler:
+                handler(rest[0] if rest else "")
+            else:
+                try:
+                    await self.get_iroha_response(user_input)
+                except Exception as e:
+                    print(f"[lỗi trong lượt trò chuyện: {e}]", file=sys.stderr)
+        print("\nIroha: Tạm biệt senpai! Hẹn gặp lại ne~ 👋")
+
+
+def main():
+    configure_logging()
+    asyncio.run(IrohaVoiceChat().run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""SQLite persistence for chat sessions and messages."""
+
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    create_engine,
+    event,
+    func,
+)
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+
+DATABASE_URL = "sqlite:///./iroha_chat.db"
+
+# The default QueuePool reuses connections across sessions (no re-open per
+# checkout) while still giving every concurrent checkout its own DBAPI
+# connection — with a single shared connection, overlapping to_thread
+# sessions interleave their transactions (one request's commit flushing
+# another's half-written turn). check_same_thread is off because sessions
+# hop worker threads; pre-ping guards against a stale handle after e.g. an
+# external VACUUM.
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_pre_ping=True,
+)
+
+
+# synchronous/temp_store/cache_size are per-connection settings, so they
+# must be applied on every checkout the pool opens, not just the first.
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+
+# SQLite commit latency is dominated by fsync; WAL with synchronous=NORMAL
+# keeps durability-on-crash while making commits cheap and readers
+# non-blocking. journal_mode is persistent in the file, so once is enough.
+with engine.connect() as conn:
+    conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+SessionLocal = sessionmaker(bind=engine, autoflush=False)
+Base = declarative_base()
+
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(200), default="Cuộc trò chuyện mới")
+    persona = Column(String(50), default="iroha")
+    # Rolling summary of turns no longer kept verbatim in the context.
+    summary = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    messages = relationship(
+        "ChatMessage", back_populates="session", cascade="all, delete-orphan"
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "persona": self.persona,
+            "summary": self.summary,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    # Every history lookup filters by session and orders by created_at; the
+    # composite index turns that into an index range scan instead of a
+    # scan-and-sort over the whole table.
+    __table_args__ = (Index("ix_msg_session_created", "session_id", "created_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"))
+    role = Column(String(20))
+    content = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    session = relationship("ChatSession", back_populates="messages")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "role": self.role,
+            "content": self.content,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist, so databases created before the
+# index was added need it applied by hand.
+with engine.begin() as conn:
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_msg_session_created"
+        " ON chat_messages(session_id, created_at)"
+    )
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(chat_sessions)")]
+    if "summary" not in columns:
+        conn.exec_driver_sql("ALTER TABLE chat_sessions ADD COLUMN summary TEXT")
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class ChatDatabase:
+    """Data-access layer used by the backend and the CLI."""
+
+    @contextmanager
+    def _session(self):
+        """Yield an ORM session that is always closed, even on error."""
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def create_session(self, title: str = None, persona: str = "iroha") -> dict:
+        with self._session() as db:
+            session = ChatSession(title=title or "Cuộc trò chuyện mới", persona=persona)
+            db.add(session)
+            db.commit()
+            db.refresh(session)
+            return session.to_dict()
+
+    def add_message(self, session_id: int, role: str, content: str) -> dict:
+        with self._session() as db:
+            message = ChatMessage(session_id=session_id, role=role, content=content)
+            db.add(message)
+            session = db.query(ChatSession).get(session_id)
+            if session:
+                session.updated_at = datetime.utcnow()
+            db.commit()
+            db.refresh(message)
+            return message.to_dict()
+
+    def add_message_pair(
+        self, session_id: int, user_content: str, assistant_content: str
+    ) -> list:
+        """Persist one full turn (user + assistant) in a single transaction.
+
+        Each turn used to cost two commits and therefore two fsyncs; batching
+        them halves the per-turn DB latency.
+        """
+        with self._session() as db:
+            user_msg = ChatMessage(session_id=session_id, role="user", content=user_content)
+            assistant_msg = ChatMessage(
+                session_id=session_id, role="assistant", content=assistant_content
+            )
+            db.add_all([user_msg, assistant_msg])
+            session = db.query(ChatSession).get(session_id)
+            if session:
+                session.updated_at = datetime.utcnow()
+            db.commit()
+            db.refresh(user_msg)
+            db.refresh(assistant_msg)
+            return [user_msg.to_dict(), assistant_msg.to_dict()]
+
+    def set_session_summary(self, session_id: int, summary: str) -> None:
+        """Persist the rolling summary so it survives restarts."""
+        with self._session() as db:
+            session = db.query(ChatSession).get(session_id)
+            if session:
+                session.summary = summary
+                db.commit()
+
+    def get_session_messages(self, session_id: int) -> list:
+        with self._session() as db:
+            messages = (
+                db.query(ChatMessage)
+                .filter(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.created_at)
+                .all()
+            )
+            return [m.to_dict() for m in messages]
+
+    def get_session_history(self, session_id: int, limit: int = 24) -> list:
+        """Recent history in the shape the LLM expects ({role, content} dicts).
+
+        Only the newest ``limit`` messages are fetched (``ORDER BY id DESC
+        LIMIT`` is an index range scan, then reversed back into order), so
+        prefill stays O(1) per turn instead of growing with the session. The
+        persisted summary, when one exists, is prepended as a system message
+        to keep long-range context without the tokens.
+        """
+        with self._session() as db:
+            messages = (
+                db.query(ChatMessage)
+                .filter(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.id.desc())
+                .limit(limit)
+                .all()
+            )
+            history = [
+                {"role": m.role, "content": m.content} for m in reversed(messages)
+            ]
+            summary = (
+                db.query(ChatSession.summary)
+                .filter(ChatSession.id == session_id)
+                .scalar()
+            )
+            if summary:
+                history.insert(
+                    0,
+                    {
+                        "role": "system",
+                        "content": f"Tóm tắt cuộc trò chuyện trước đó: {summary}",
+                    },
+                )
+            return history
+
+    def get_all_sessions(self) -> list:
+        """List sessions newest-first with message counts.
+
+        Counting via ``len(s.messages)`` lazy-loaded one SELECT per session
+        (N+1); a grouped outer join gets everything in a single round trip.
+        """
+        with self._session() as db:
+            rows = (
+                db.query(ChatSession, func.count(ChatMessage.id))
+                .outerjoin(ChatMessage)
+                .group_by(ChatSession.id)
+                .order_by(ChatSession.updated_at.desc())
+                .all()
+            )
+            return [
+                {**session.to_dict(), "message_count": count}
+                for session, count in rows
+            ]
+
+    def delete_session(self, session_id: int) -> bool:
+        with self._session() as db:
+            session = db.query(ChatSession).get(session_id)
+            if not session:
+                return False
+            db.delete(session)
+            db.commit()
+            return True
+
+
+chat_db = ChatDatabase()
@@ -0,0 +1,126 @@
+"""Unit tests for the dependency-light logic in the hot paths.
+
+Each module is import-skipped so the suite degrades gracefully in
+environments without the full dependency stack installed.
+"""
+
+import asyncio
+import io
+import wave
+
+import pytest
+
+ai_core = pytest.importorskip("ai_core")
+voice_groq = pytest.importorskip("voice_groq")
+backend_main = pytest.importorskip("backend.main")
+
+
+def _msg(tokens: int) -> dict:
+    # Preset _tok so counts are deterministic and no tokenizer runs.
+    return {"role": "user", "content": "x" * (tokens * 4), "_tok": tokens}
+
+
+class TestTrimHistory:
+    @pytest.fixture(autouse=True)
+    def _estimates_only(self, monkeypatch):
+        monkeypatch.setattr(ai_core.Config, "EXACT_TOKEN_COUNT", False)
+
+    def test_fitting_history_returned_untrimmed(self):
+        history = [_msg(10) for _ in range(5)]
+        assert ai_core.ai_service.trim_history(history, max_tokens=100) == history
+
+    def test_over_budget_trims_to_three_quarters(self):
+        # 10 x 30 tokens against a 100-token budget: hysteresis targets 75,
+        # so exactly the last two messages (60 tokens) survive.
+        history = [_msg(30) for _ in range(10)]
+        trimmed = ai_core.ai_service.trim_history(history, max_tokens=100)
+        assert trimmed == history[-2:]
+
+    def test_borderline_message_recounted_exactly(self):
+        # The middle message estimates to 30 tokens (120 chars / 4), putting
+        # the walk at 80 > 75 but inside the 10% borderline window; its true
+        # BPE count ("a" runs compress heavily) fits, so it must be kept.
+        history = [
+            _msg(60),
+            {"role": "user", "content": "a" * 120},
+            _msg(50),
+        ]
+        trimmed = ai_core.ai_service.trim_history(history, max_tokens=100)
+        assert trimmed == history[-2:]
+
+
+class TestSentenceBuffer:
+    def test_cuts_at_sentence_end(self):
+        buf = voice_groq._SentenceBuffer()
+        assert buf.push("Xin chào senpai. Hôm nay") == ["Xin chào senpai."]
+        assert buf.flush() == "Hôm nay"
+
+    def test_abbreviation_is_not_a_boundary(self):
+        buf = voice_groq._SentenceBuffer()
+        assert buf.push("Dr. Iroha says hi. ok") == ["Dr. Iroha says hi."]
+
+    def test_too_short_sentence_is_held(self):
+        buf = voice_groq._SentenceBuffer()
+        assert buf.push("Hi. there") == []
+        assert buf.flush() == "Hi. there"
+
+    def test_first_flush_forced_at_limit(self):
+        buf = voice_groq._SentenceBuffer()
+        assert buf.push("b" * 150) == []
+        assert buf.push("b" * 100) == ["b" * buf.FIRST_FLUSH_CHARS]
+        assert buf.flush() == "b" * 50
+
+    def test_forced_cut_lands_on_a_word_boundary(self):
+        buf = voice_groq._SentenceBuffer()
+        chunks = buf.push("word " * 50)
+        assert chunks and chunks[0].endswith("word")
+
+    def test_later_flushes_wait_for_max_limit(self):
+        buf = voice_groq._SentenceBuffer()
+        buf.push("b" * 200)  # consumes the first-flush allowance
+        assert buf.push("c" * 400) == []  # 400 < MAX_FLUSH_CHARS
+        assert buf.push("c" * 300) == ["c" * buf.MAX_FLUSH_CHARS]
+
+
+def _wav(frames: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\x01\x02" * frames)
+    return buf.getvalue()
+
+
+class TestStitchWavs:
+    def test_result_is_one_valid_wav(self):
+        stitched = voice_groq._stitch_wavs([_wav(100), _wav(50)])
+        with wave.open(io.BytesIO(stitched)) as w:
+            assert w.getnframes() == 150
+            assert w.getnchannels() == 1
+            assert w.getframerate() == 16000
+
+    def test_empty_input(self):
+        assert voice_groq._stitch_wavs([]) == b""
+
+
+class TestCoalesce:
+    @staticmethod
+    def _collect(chunks, size):
+        async def source():
+            for chunk in chunks:
+                yield chunk
+
+        async def run():
+            return [c async for c in backend_main._coalesce(source(), size=size)]
+
+        return asyncio.run(run())
+
+    def test_small_chunks_are_batched(self):
+        out = self._collect([b"a" * 5120] * 4, size=16384)
+        assert out == [b"a" * 20480]
+
+    def test_remainder_is_flushed(self):
+        out = self._collect([b"a" * 5120] * 4 + [b"b" * 100], size=16384)
+        assert b"".join(out) == b"a" * 20480 + b"b" * 100
+        assert len(out) == 2
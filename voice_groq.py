@@ -0,0 +1,599 @@
+"""Groq PlayAI text-to-speech client used by the CLI and the backend."""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+from types import MappingProxyType
+
+import httpx
+from groq import AsyncGroq, RateLimitError
+from loguru import logger
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from _http import shared_http
+
+def configure_logging() -> None:
+    """Attach the rotating file sink; call once from the app entry point.
+
+    Importing the module no longer opens a log file, so test collection
+    and tooling imports stay side-effect free; set IROHA_LOG_TO_FILE to
+    enable the sink at all.
+    """
+    if not os.getenv("IROHA_LOG_TO_FILE"):
+        return
+    logger.add(
+        "logs/voice_groq_{time}.log",
+        rotation="1 day",
+        level=os.getenv("LOG_LEVEL", "INFO"),
+    )
+
+# Cap on in-flight TTS requests. Sentence fan-out should saturate the
+# provider without tripping its rate limit, so keep this at a few.
+GROQ_TTS_CONCURRENCY = int(os.getenv("GROQ_TTS_CONCURRENCY", "4"))
+
+# Iroha's stock phrases repeat across sessions; caching their audio turns a
+# 200-500 ms billed round trip into a dict lookup. Bounded in memory, and
+# mirrored to disk so the cache survives restarts.
+_AUDIO_CACHE_MAX = 128
+GROQ_TTS_CACHE_TTL = float(os.getenv("GROQ_TTS_CACHE_TTL", str(7 * 24 * 3600)))
+GROQ_TTS_CACHE_MAX_BYTES = int(
+    os.getenv("GROQ_TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+# Streaming read size. 4 KiB meant ~125 yields (each a full trip through the
+# ASGI stack) for a typical clip; 64 KiB cuts that 16x while still flushing
+# well under the length of a sentence.
+_STREAM_CHUNK = 65536
+
+
+# Voice/format tables are process-wide constants; freezing them at module
+# scope means re-instantiation (uvicorn reload, subprocesses) shares one
+# object instead of rebuilding dicts, and nothing can mutate them.
+_AVAILABLE_VOICES = MappingProxyType(
+    {
+        "aaliyah": "Aaliyah-PlayAI",
+        "arista": "Arista-PlayAI",
+        "briggs": "Briggs-PlayAI",
+        "celeste": "Celeste-PlayAI",
+        "cheyenne": "Cheyenne-PlayAI",
+        "gail": "Gail-PlayAI",
+        "indigo": "Indigo-PlayAI",
+        "quinn": "Quinn-PlayAI",
+    }
+)
+_ALLOWED_SAMPLE_RATES = frozenset({8000, 16000, 22050, 24000, 32000, 44100, 48000})
+
+
+def _retry_wait(retry_state):
+    """Honor Retry-After when the provider sends one, else back off randomly."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    return wait_random_exponential(min=0.2, max=4)(retry_state)
+
+
+def _log_retry(retry_state):
+    logger.warning(
+        "TTS attempt {} failed, retrying: {}",
+        retry_state.attempt_number,
+        retry_state.outcome.exception(),
+    )
+
+
+def _stitch_wavs(chunks: list) -> bytes:
+    """Join complete per-sentence WAV clips into one valid file.
+
+    Naive byte concatenation would leave a stray RIFF header embedded at
+    every clip boundary. This reads the format from the first header, joins
+    the PCM payloads in a single pass (one allocation, one memcpy each),
+    and writes one fresh header — no pydub decode/re-encode round trip.
+    """
+    import io
+    import wave
+
+    if not chunks:
+        return b""
+    with wave.open(io.BytesIO(bytes(chunks[0]))) as first:
+        channels = first.getnchannels()
+        sampwidth = first.getsampwidth()
+        framerate = first.getframerate()
+    payload = b"".join(memoryview(chunk)[44:] for chunk in chunks)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(sampwidth)
+        out.setframerate(framerate)
+        out.writeframes(payload)
+    return buf.getvalue()
+
+
+# Boundaries that end a speakable chunk, and trailing tokens that look like
+# sentence ends but are not (don't cut "Dr. Iroha" in half).
+_SENTENCE_ENDS = (". ", "! ", "? ", "\n")
+_ABBREVIATIONS = ("Dr.", "Mr.", "Mrs.", "Ms.", "St.", "TS.", "ThS.", "GS.")
+
+
+class _SentenceBuffer:
+    """Accumulates streamed LLM text and cuts it at speakable boundaries.
+
+    The first cut happens as early as possible — first sentence end, or 200
+    chars — so audio starts while the model is still decoding; later cuts
+    wait for sentence ends up to 700 chars so TTS requests stay a sensible
+    size.
+    """
+
+    FIRST_FLUSH_CHARS = 200
+    MAX_FLUSH_CHARS = 700
+    MIN_SENTENCE_CHARS = 10
+
+    def __init__(self):
+        self._buf = ""
+        self._first = True
+
+    def push(self, delta: str) -> list:
+        """Append a text delta; return any chunks that are ready to speak."""
+        self._buf += delta
+        out = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            out.append(self._buf[:cut].strip())
+            self._buf = self._buf[cut:]
+            self._first = False
+        return [chunk for chunk in out if chunk]
+
+    def flush(self) -> str:
+        """Return whatever is left once the stream ends."""
+        tail, self._buf = self._buf.strip(), ""
+        return tail
+
+    def _find_cut(self):
+        best = None
+        for mark in _SENTENCE_ENDS:
+            idx = self._buf.find(mark)
+            while idx != -1:
+                end = idx + len(mark)
+                if end >= self.MIN_SENTENCE_CHARS and not self._buf[
+                    : idx + 1
+                ].endswith(_ABBREVIATIONS):
+                    if best is None or end < best:
+                        best = end
+                    break
+                idx = self._buf.find(mark, idx + 1)
+        if best is not None:
+            return best
+        limit = self.FIRST_FLUSH_CHARS if self._first else self.MAX_FLUSH_CHARS
+        if len(self._buf) >= limit:
+            # No boundary in sight; cut at the last space so no word splits.
+            space = self._buf.rfind(" ", 0, limit)
+            return space + 1 if space > 0 else limit
+        return None
+
+
+class GroqVoiceService:
+    """Async wrapper around Groq's PlayAI TTS endpoint."""
+
+    model = "playai-tts"
+    default_voice = "Aaliyah-PlayAI"
+    available_voices = _AVAILABLE_VOICES
+    allowed_sample_rates = _ALLOWED_SAMPLE_RATES
+
+    def __init__(self):
+        self.client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY", ""), http_client=shared_http)
+        self._warmed_voices = set()
+        self._tts_semaphore = asyncio.Semaphore(GROQ_TTS_CONCURRENCY)
+        self._audio_cache = OrderedDict()
+        self._audio_cache_lock = asyncio.Lock()
+        # Strong refs to in-flight cache writes: the loop only keeps weak
+        # references to tasks, so an unanchored persist task can be
+        # garbage-collected before it runs.
+        self._persist_tasks = set()
+
+    # Directory setup and the disk-cache scan are deferred to first use so
+    # constructing the singleton at import costs no syscalls.
+    @cached_property
+    def output_dir(self) -> Path:
+        path = Path("voice_outputs")
+        path.mkdir(exist_ok=True)
+        return path
+
+    @cached_property
+    def _cache_dir(self) -> Path:
+        path = self.output_dir / "_cache"
+        path.mkdir(exist_ok=True)
+        return path
+
+    @cached_property
+    def _cache_files(self) -> dict:
+        """Disk index of clips cached by earlier runs (sharded subdirs)."""
+        files = {}
+        with os.scandir(self._cache_dir) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.name.endswith(".wav"):
+                            files[entry.name[:-4]] = Path(entry.path)
+        return files
+
+    def _resolve_voice(self, voice: str = None) -> str:
+        if not voice:
+            return self.default_voice
+        return self.available_voices.get(voice.lower(), voice)
+
+    async def warmup(self, voice: str = None) -> None:
+        """Prime the TTS pipeline for ``voice`` ahead of the first sentence.
+
+        The provider pays a per-voice cold start on the first request;
+        synthesizing a minimal clip while the LLM is still decoding hides
+        that latency. No-op after the first call per voice, and failures are
+        swallowed — the real request will surface any persistent error.
+        """
+        voice = self._resolve_voice(voice)
+        if voice in self._warmed_voices:
+            return
+        self._warmed_voices.add(voice)
+        try:
+            # Bypass the audio cache: the point is priming the provider,
+            # which a cache hit would skip.
+            await self._synthesize("...", voice, 1.0, 8000)
+        except Exception as e:
+            logger.warning("TTS warmup failed: {}", e)
+
+    @staticmethod
+    def _cache_key(text: str, voice: str, speed: float, sample_rate: int) -> str:
+        return hashlib.blake2b(
+            f"{voice}|{speed}|{sample_rate}|{text}".encode(), digest_size=16
+        ).hexdigest()
+
+    def _cache_file(self, key: str) -> Path:
+        return self._cache_dir / key[:2] / f"{key}.wav"
+
+    def _persist_done(self, task) -> None:
+        self._persist_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Audio cache write failed: {}", task.exception())
+
+    def _persist(self, key: str, audio: bytes) -> None:
+        """Write a clip into the disk cache atomically, then bound its size.
+
+        The tmp-then-rename dance means a crash mid-write never leaves a
+        truncated WAV behind for a later hit to serve.
+        """
+        path = self._cache_file(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(audio)
+        tmp.rename(path)
+        self._cache_files[key] = path
+        self._evict_disk_cache()
+
+    def _evict_disk_cache(self) -> None:
+        """Drop least-recently-read clips once the cache exceeds its budget."""
+        entries = []
+        total = 0
+        for key, path in list(self._cache_files.items()):
+            try:
+                st = path.stat()
+            except OSError:
+                self._cache_files.pop(key, None)
+                continue
+            entries.append((st.st_atime, st.st_size, key, path))
+            total += st.st_size
+        if total <= GROQ_TTS_CACHE_MAX_BYTES:
+            return
+        for _, size, key, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            self._cache_files.pop(key, None)
+            total -= size
+            if total <= GROQ_TTS_CACHE_MAX_BYTES:
+                break
+
+    async def _remember(self, key: str, audio: bytes) -> None:
+        async with self._audio_cache_lock:
+            self._audio_cache[key] = audio
+            self._audio_cache.move_to_end(key)
+            while len(self._audio_cache) > _AUDIO_CACHE_MAX:
+                self._audio_cache.popitem(last=False)
+
+    @retry(
+        wait=_retry_wait,
+        stop=stop_after_attempt(5),
+        retry=retry_if_exception_type((RateLimitError, httpx.RemoteProtocolError)),
+        before_sleep=_log_retry,
+        reraise=True,
+    )
+    async def _synthesize(
+        self, text: str, voice: str, speed: float, sample_rate: int
+    ) -> bytes:
+        """Hit the TTS endpoint and return the full WAV payload.
+
+        Transient 429s and dropped connections are retried with capped
+        exponential backoff (honoring Retry-After when present); the
+        semaphore bounds our outgoing rate, this absorbs residual bursts.
+        """
+        logger.info("Generating TTS - Voice: {}, Speed: {}", voice, speed)
+        response = await self.client.audio.speech.create(
+            model=self.model,
+            voice=voice,
+            input=text,
+            response_format="wav",
+            sample_rate=sample_rate,
+            speed=speed,
+        )
+        return await response.read()
+
+    async def generate_audio(
+        self,
+        text: str,
+        voice: str = None,
+        speed: float = 1.0,
+        sample_rate: int = 48000,
+    ) -> bytes:
+        """Synthesize ``text``, serving repeats from the audio cache."""
+        voice = self._resolve_voice(voice)
+        if sample_rate not in self.allowed_sample_rates:
+            sample_rate = 48000
+        key = self._cache_key(text, voice, speed, sample_rate)
+        async with self._audio_cache_lock:
+            cached = self._audio_cache.get(key)
+            if cached is not None:
+                self._audio_cache.move_to_end(key)
+                return cached
+        cache_path = self._cache_files.get(key)
+        if cache_path is not None:
+            try:
+                if time.time() - cache_path.stat().st_mtime <= GROQ_TTS_CACHE_TTL:
+                    audio = await asyncio.to_thread(cache_path.read_bytes)
+                    await self._remember(key, audio)
+                    return audio
+            except OSError:
+                pass
+        try:
+            audio = await self._synthesize(text, voice, speed, sample_rate)
+        except Exception as e:
+            logger.error("TTS generation failed: {}", e)
+            raise
+        await self._remember(key, audio)
+        task = asyncio.create_task(asyncio.to_thread(self._persist, key, audio))
+        self._persist_tasks.add(task)
+        task.add_done_callback(self._persist_done)
+        return audio
+
+    async def stream_audio(
+        self,
+        text: str,
+        voice: str = None,
+        speed: float = 1.0,
+        sample_rate: int = 48000,
+        chunk_size: int = _STREAM_CHUNK,
+        chunk_ms: int = None,
+    ):
+        """Yield WAV bytes as they arrive from the wire.
+
+        The old version awaited the full synthesis and then sliced the
+        buffer, so time-to-first-byte equalled full synthesis latency.
+        Streaming the HTTP body directly drops TTFB to the first chunk and
+        never materializes the whole payload in memory. Pass ``chunk_ms``
+        to size chunks in playback time instead of bytes (16-bit mono PCM
+        assumed), e.g. for consumers that schedule writes per audio frame.
+        """
+        voice = self._resolve_voice(voice)
+        if sample_rate not in self.allowed_sample_rates:
+            sample_rate = 48000
+        if chunk_ms:
+            chunk_size = max(4096, sample_rate * 2 * chunk_ms // 1000)
+        logger.info("Streaming TTS - Voice: {}, Speed: {}", voice, speed)
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=voice,
+            input=text,
+            response_format="wav",
+            sample_rate=sample_rate,
+            speed=speed,
+        ) as response:
+            async for chunk in response.iter_bytes(chunk_size):
+                yield chunk
+
+    async def save_audio_file(
+        self,
+        text: str,
+        filename: str = None,
+        voice: str = None,
+        speed: float = 1.0,
+        sample_rate: int = 48000,
+    ) -> Path:
+        """Synthesize ``text`` and write it under ``voice_outputs/``.
+
+        The clip goes through (and populates) the audio cache, and the user
+        file is hardlinked from the cached WAV when the filesystem allows —
+        a metadata-only operation with no second copy of the payload.
+        """
+        if not filename:
+            filename = f"iroha_{datetime.now():%Y%m%d_%H%M%S}.wav"
+        file_path = self.output_dir / filename
+        voice = self._resolve_voice(voice)
+        if sample_rate not in self.allowed_sample_rates:
+            sample_rate = 48000
+        audio = await self.generate_audio(text, voice, speed, sample_rate)
+        key = self._cache_key(text, voice, speed, sample_rate)
+        cache_path = self._cache_files.get(key)
+        if cache_path is None or not cache_path.exists():
+            await asyncio.to_thread(self._persist, key, audio)
+            cache_path = self._cache_file(key)
+        try:
+            file_path.unlink(missing_ok=True)
+            await asyncio.to_thread(os.link, cache_path, file_path)
+        except OSError:
+            # Cross-device or link-hostile filesystem: plain copy.
+            await asyncio.to_thread(file_path.write_bytes, audio)
+        logger.info("Saved audio to {}", file_path)
+        return file_path
+
+    async def _bounded_generate(self, text: str, **kwargs) -> bytes:
+        """generate_audio behind the shared concurrency cap."""
+        async with self._tts_semaphore:
+            return await self.generate_audio(text, **kwargs)
+
+    async def _synthesize_ordered(
+        self,
+        sentences: list,
+        voice: str = None,
+        speed: float = 1.0,
+        sample_rate: int = 48000,
+    ):
+        """Synthesize ``sentences`` concurrently, yielding clips in order.
+
+        Launching every request up front turns total wall time from
+        sum(t_i) into roughly max(t_i); the semaphore keeps the fan-out
+        within GROQ_TTS_CONCURRENCY so bursts stay inside the rate limit.
+        """
+        tasks = [
+            asyncio.create_task(
+                self._bounded_generate(
+                    sentence, voice=voice, speed=speed, sample_rate=sample_rate
+                )
+            )
+            for sentence in sentences
+        ]
+        for task in tasks:
+            yield await task
+
+    async def progressive_speak(self, text_stream, voice: str = None, speed: float = 1.05):
+        """Speak an LLM token stream sentence-by-sentence as it decodes.
+
+        Each chunk the sentence buffer flushes is dispatched to TTS
+        immediately, so synthesis overlaps the decode, and the clips are
+        yielded in dispatch order. Clips after the first have their 44-byte
+        RIFF header stripped so the concatenation stays one playable WAV.
+        First-audio latency becomes O(first sentence) instead of O(reply).
+        """
+        queue = asyncio.Queue()
+
+        def dispatch(sentence: str) -> None:
+            queue.put_nowait(
+                asyncio.create_task(
+                    self._bounded_generate(sentence, voice=voice, speed=speed)
+                )
+            )
+
+        async def produce():
+            buf = _SentenceBuffer()
+            async for delta in text_stream:
+                for sentence in buf.push(delta):
+                    dispatch(sentence)
+            tail = buf.flush()
+            if tail:
+                dispatch(tail)
+            queue.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        first = True
+        try:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                try:
+                    audio = await task
+                except Exception as e:
+                    # Same policy as the CLI player: a clip that failed
+                    # after retries is skipped, the rest of the reply
+                    # still plays.
+                    logger.warning("Skipping failed TTS clip: {}", e)
+                    continue
+                # memoryview slice: skip the RIFF header without copying
+                # the clip (a plain bytes slice would memcpy every byte).
+                yield audio if first else memoryview(audio)[44:]
+                first = False
+        finally:
+            # The consumer can disappear mid-stream (client disconnect
+            # cancels the generator); stop the producer and every queued
+            # synthesis task so a gone client stops billing LLM + TTS
+            # work, and await them so no exception goes unretrieved.
+            producer.cancel()
+            pending = [producer]
+            while True:
+                try:
+                    task = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if task is not None:
+                    task.cancel()
+                    pending.append(task)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def save_progressive(
+        self,
+        text_stream,
+        filename: str = None,
+        voice: str = None,
+        speed: float = 1.05,
+    ) -> Path:
+        """Synthesize a token stream sentence-by-sentence into one WAV file.
+
+        Sentences are dispatched as the buffer cuts them, so synthesis
+        overlaps the decode just like progressive_speak; the finished clips
+        are then stitched through _stitch_wavs, since naive byte
+        concatenation would embed a RIFF header at every clip boundary.
+        """
+        buf = _SentenceBuffer()
+        tasks = []
+
+        def dispatch(sentence: str) -> None:
+            tasks.append(
+                asyncio.create_task(
+                    self._bounded_generate(sentence, voice=voice, speed=speed)
+                )
+            )
+
+        async for delta in text_stream:
+            for sentence in buf.push(delta):
+                dispatch(sentence)
+        tail = buf.flush()
+        if tail:
+            dispatch(tail)
+        audio = _stitch_wavs([await task for task in tasks])
+        if not filename:
+            filename = f"iroha_{datetime.now():%Y%m%d_%H%M%S}.wav"
+        file_path = self.output_dir / filename
+        await asyncio.to_thread(file_path.write_bytes, audio)
+        logger.info("Saved audio to {}", file_path)
+        return file_path
+
+    async def iroha_speak(self, text: str, voice: str = None, speed: float = 1.05) -> bytes:
+        """Convenience wrapper with Iroha's default delivery speed."""
+        return await self.generate_audio(text, voice=voice, speed=speed)
+
+
+groq_voice = GroqVoiceService()
+
+
+async def speak_llm_stream(token_stream, voice: str = None, speed: float = 1.05):
+    """LLM token stream in, ordered WAV chunks out.
+
+    Module-level entry point for pipeline callers: the first TTS request
+    fires as soon as the sentence buffer cuts the first chunk, so synthesis
+    overlaps the rest of the decode instead of waiting for the full reply.
+    """
+    async for chunk in groq_voice.progressive_speak(
+        token_stream, voice=voice, speed=speed
+    ):
+        yield chunk
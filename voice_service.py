@@ -0,0 +1,264 @@
+"""Free TTS (Microsoft Edge) and STT helpers, no API key required."""
+
+import asyncio
+import io
+import os
+from datetime import datetime
+from functools import cached_property
+from pathlib import Path
+
+import aiofiles
+import edge_tts
+import speech_recognition as sr
+from loguru import logger
+from pydub import AudioSegment
+from pydub.playback import play
+
+def configure_logging() -> None:
+    """Attach the rotating file sink; call once from the app entry point.
+
+    Set IROHA_LOG_TO_FILE to enable the sink at all.
+    """
+    if not os.getenv("IROHA_LOG_TO_FILE"):
+        return
+    logger.add(
+        "logs/voice_service_{time}.log",
+        rotation="1 day",
+        level=os.getenv("LOG_LEVEL", "INFO"),
+    )
+
+
+class VoiceService:
+    """Edge TTS synthesis plus microphone/file speech recognition."""
+
+    def __init__(self):
+        self.voices = {
+            "vi_female": "vi-VN-HoaiMyNeural",
+            "vi_male": "vi-VN-NamMinhNeural",
+            "ja_female": "ja-JP-NanamiNeural",
+            "ja_male": "ja-JP-KeitaNeural",
+            "en_female": "en-US-JennyNeural",
+        }
+        self.default_voice = "vi_female"
+        self.recognizer = sr.Recognizer()
+        self._warmed_voices = set()
+
+    @cached_property
+    def output_dir(self) -> Path:
+        """Created on first synthesis rather than at import."""
+        path = Path("voice_outputs")
+        path.mkdir(exist_ok=True)
+        return path
+
+    @cached_property
+    def _asr(self):
+        """Local Whisper model, loaded on first transcription.
+
+        CTranslate2's int8 path is roughly 4x faster than the reference
+        PyTorch implementation and removes the 500-1500 ms network round
+        trip (and outage risk) of the Google web endpoint.
+        """
+        from faster_whisper import WhisperModel
+
+        return WhisperModel("small", device="auto", compute_type="int8")
+
+    @cached_property
+    def _vad(self):
+        """Silero VAD (~2 MB), loaded on first microphone capture."""
+        import torch
+
+        model, _ = torch.hub.load(
+            "snakers4/silero-vad", "silero_vad", trust_repo=True
+        )
+        return model
+
+    def _listen_vad(self, timeout: int = 5) -> io.BytesIO:
+        """Record one utterance, ending on 700 ms of trailing silence.
+
+        Replaces the ambient-noise calibration (a flat 0.5 s per turn) and
+        the fixed listen timeout: each 32 ms frame is scored by the VAD in
+        under a millisecond, so the turn ends 700 ms after the speaker
+        stops instead of whenever the timer expires. ``timeout`` bounds how
+        long to wait for speech to start.
+        """
+        import wave
+
+        import numpy as np
+        import sounddevice as sd
+        import torch
+
+        sample_rate = 16000
+        frame = 512  # 32 ms at 16 kHz, the window Silero was trained on
+        silence_limit = int(0.7 * sample_rate / frame)
+        idle_limit = int(timeout * sample_rate / frame)
+        captured = []
+        speaking = False
+        quiet = idle = 0
+        with sd.RawInputStream(
+            samplerate=sample_rate, blocksize=frame, channels=1, dtype="int16"
+        ) as stream:
+            while True:
+                raw, _ = stream.read(frame)
+                pcm = np.frombuffer(raw, dtype=np.int16)
+                prob = self._vad(
+                    torch.from_numpy(pcm.astype(np.float32) / 32768.0), sample_rate
+                ).item()
+                if prob >= 0.5:
+                    speaking = True
+                    quiet = 0
+                    captured.append(bytes(raw))
+                elif speaking:
+                    quiet += 1
+                    captured.append(bytes(raw))
+                    if quiet >= silence_limit:
+                        break
+                else:
+                    idle += 1
+                    if idle >= idle_limit:
+                        break
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(b"".join(captured))
+        buf.seek(0)
+        return buf
+
+    def get_available_voices(self) -> dict:
+        """Voice keys and their Edge voice names for the UI."""
+        return dict(self.voices)
+
+    async def warmup(self, voice_key: str = None) -> None:
+        """Prime Edge TTS for ``voice_key`` ahead of the first real request.
+
+        edge-tts binds the text at construction and closes its websocket
+        after one stream(), so a persistent per-voice socket pool is not
+        possible through its public API. What can be shaved off the first
+        turn is the DNS lookup and the full TLS handshake: synthesizing a
+        minimal utterance once per voice warms the resolver cache and TLS
+        session tickets, letting later handshakes resume in one round trip.
+        No-op after the first call per voice; failures are swallowed — the
+        real request will surface any persistent error.
+        """
+        key = voice_key or self.default_voice
+        if key in self._warmed_voices:
+            return
+        self._warmed_voices.add(key)
+        try:
+            async for _ in self.text_to_speech_stream(".", key):
+                break
+        except Exception as e:
+            logger.warning("Edge TTS warmup failed: {}", e)
+
+    async def text_to_speech_stream(
+        self,
+        text: str,
+        voice_key: str = None,
+        rate: str = "+0%",
+        pitch: str = "+0Hz",
+    ):
+        """Yield MP3 bytes as Edge synthesizes them.
+
+        ``Communicate.save`` blocks until the last byte is on disk; the
+        stream() iterator hands chunks over as they arrive, so playback or
+        upload can start ~200 ms in instead of after full synthesis.
+        """
+        voice = self.voices.get(voice_key or self.default_voice, self.voices[self.default_voice])
+        logger.info("Edge TTS stream - Voice: {}, Rate: {}", voice, rate)
+        communicate = edge_tts.Communicate(text, voice, rate=rate, pitch=pitch)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+    async def text_to_speech(
+        self,
+        text: str,
+        voice_key: str = None,
+        rate: str = "+0%",
+        pitch: str = "+0Hz",
+    ) -> Path:
+        """Synthesize ``text`` to an MP3 under ``voice_outputs/``."""
+        output_file = self.output_dir / f"tts_{datetime.now():%Y%m%d_%H%M%S_%f}.mp3"
+        async with aiofiles.open(output_file, "wb") as f:
+            async for chunk in self.text_to_speech_stream(text, voice_key, rate, pitch):
+                await f.write(chunk)
+        return output_file
+
+    def speech_to_text(
+        self,
+        audio_file=None,
+        language: str = "vi-VN",
+        timeout: int = 5,
+    ) -> str:
+        """Transcribe a WAV path or file-like object, or listen on the mic."""
+        if audio_file is not None:
+            target = audio_file if hasattr(audio_file, "read") else str(audio_file)
+        else:
+            try:
+                target = self._listen_vad(timeout)
+            except ImportError:
+                # torch/sounddevice unavailable: fall back to the old
+                # calibrate-and-listen capture.
+                with sr.Microphone() as source:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                    audio = self.recognizer.listen(source, timeout=timeout)
+                target = io.BytesIO(audio.get_wav_data())
+        segments, _ = self._asr.transcribe(
+            target, language=language[:2], vad_filter=True
+        )
+        return " ".join(segment.text.strip() for segment in segments)
+
+    async def speech_to_text_async(
+        self,
+        audio_file=None,
+        language: str = "vi-VN",
+        timeout: int = 5,
+    ) -> str:
+        """speech_to_text without blocking the event loop."""
+        return await asyncio.to_thread(
+            self.speech_to_text, audio_file, language, timeout
+        )
+
+    @staticmethod
+    def _play_wav_fast(path) -> None:
+        """Synchronous WAV playback without pydub's decode round trip.
+
+        AudioSegment.from_file shells out to FFmpeg and copies the whole
+        clip through pydub's sample array before re-encoding for the output
+        device; WAV is already PCM, so reading the frames and handing them
+        to sounddevice skips all of that (same approach as the CLI player).
+        """
+        import wave
+
+        import numpy as np
+        import sounddevice as sd
+
+        with wave.open(str(path)) as wav:
+            frames = wav.readframes(wav.getnframes())
+            data = np.frombuffer(frames, dtype=np.int16).reshape(
+                -1, wav.getnchannels()
+            )
+            sd.play(data, samplerate=wav.getframerate())
+            sd.wait()
+
+    async def play_audio(self, audio_file) -> None:
+        """Play a synthesized file through the default output device.
+
+        Decode and playback both block for the clip's duration, so they run
+        in worker threads — LLM and TTS tasks keep making progress while
+        audio is on the speaker. WAV (Groq output) takes the direct PCM
+        path; pydub only decodes compressed formats like Edge's MP3.
+        """
+        if Path(str(audio_file)).suffix.lower() == ".wav":
+            await asyncio.to_thread(self._play_wav_fast, audio_file)
+            return
+        audio = await asyncio.to_thread(AudioSegment.from_file, audio_file)
+        await asyncio.to_thread(play, audio)
+
+    async def iroha_speak(self, text: str, rate: str = "+5%", pitch: str = "+15Hz") -> Path:
+        """Iroha's default delivery: slightly fast, slightly high."""
+        return await self.text_to_speech(text, "vi_female", rate=rate, pitch=pitch)
+
+
+voice_service = VoiceService()